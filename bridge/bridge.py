@@ -17,22 +17,98 @@ Endpoints:
 
 import sys
 import os
+import collections
 import json
+import logging
+import logging.handlers
+import selectors
+import socket
 import subprocess
 import threading
 import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse
+
+try:
+    import orjson  # optional — ~5x faster and dumps straight to bytes
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers
+# can keep catching the stdlib exception either way.
+_json_loads = orjson.loads if orjson else json.loads
 
 PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8886
 WORK_DIR = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else os.getcwd()
 
 
-def log(msg):
-    from datetime import datetime
-    ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"[bridge {ts}] {msg}", flush=True)
+logger = logging.getLogger("bridge")
+
+
+def _setup_logging():
+    """Route log records through a queue so formatting and terminal IO
+    happen on a background thread, off the claude reader's hot path."""
+    log_q = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        "[bridge %(asctime)s.%(msecs)03d] %(message)s", "%H:%M:%S"))
+    listener = logging.handlers.QueueListener(log_q, handler)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_q))
+    logger.setLevel(logging.DEBUG if os.environ.get("BRIDGE_DEBUG") else logging.INFO)
+    return listener
+
+
+_log_listener = _setup_logging()
+log = logger.info
+
+
+class ListenerQueue:
+    """Bounded deque + wakeup event — much cheaper than queue.Queue for fanout.
+
+    A consumer that falls maxlen events behind gets closed instead of
+    buffering without limit: pending events are still delivered, then
+    get() raises Closed so the SSE loop can free the socket.
+    """
+
+    class Closed(Exception):
+        pass
+
+    def __init__(self, maxlen=1024):
+        self._items = collections.deque()
+        self._maxlen = maxlen
+        self._ready = threading.Event()
+        self.closed = False
+
+    def put_nowait(self, item):
+        """Enqueue an event; returns False if the listener is (now) dead."""
+        if self.closed:
+            return False
+        if len(self._items) >= self._maxlen:
+            self.close()
+            return False
+        self._items.append(item)
+        self._ready.set()
+        return True
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    def get(self, timeout=None):
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                if self.closed:
+                    raise self.Closed()
+                self._ready.clear()
+                # Re-check: a put may have landed between popleft and clear
+                if self._items or self.closed:
+                    continue
+                if not self._ready.wait(timeout):
+                    raise queue.Empty
 
 
 class ClaudeBridge:
@@ -40,12 +116,25 @@ class ClaudeBridge:
 
     def __init__(self, work_dir):
         self.work_dir = work_dir
+        # The bridge's environment never changes mid-run, so build the
+        # child env once instead of copying os.environ per message.
+        self._child_env = {k: v for k, v in os.environ.items() if k != "CLAUDECODE"}
         self.session_id = None
         self.state = "idle"  # idle, processing
         self.current_proc = None
-        self.lock = threading.Lock()
-        self.event_listeners = []
+        # Re-entrancy gate: acquired by send_message, released by the
+        # worker. state itself is a plain attribute — the worker thread
+        # is its only writer, so no lock is needed around it.
+        self._busy = threading.Semaphore(1)
+        self.event_listeners = set()
         self.listeners_lock = threading.Lock()
+        # Fanout runs on its own thread so the claude reader never pays
+        # for framing or per-listener delivery. SimpleQueue is lighter
+        # than Queue (no task tracking) and put() is effectively O(1).
+        self._fanout_q = queue.SimpleQueue()
+        threading.Thread(
+            target=self._fanout_worker, name="fanout", daemon=True
+        ).start()
 
     @property
     def is_busy(self):
@@ -53,10 +142,10 @@ class ClaudeBridge:
 
     def send_message(self, user_message):
         """Run claude -p with the message and stream output via SSE."""
-        with self.lock:
-            if self.state == "processing":
-                return False, "Already processing a message"
-            self.state = "processing"
+        # Non-blocking acquire is a single atomic CAS in the semaphore
+        if not self._busy.acquire(blocking=False):
+            return False, "Already processing a message"
+        self.state = "processing"
 
         # Run in a thread so we don't block the HTTP response
         threading.Thread(
@@ -80,61 +169,74 @@ class ClaudeBridge:
         if self.session_id:
             claude_args.extend(["--resume", self.session_id])
 
-        env = os.environ.copy()
-        env.pop("CLAUDECODE", None)
-
         log(f"Running: claude -p '{user_message[:80]}...' (session={self.session_id})")
 
         try:
+            # No preexec_fn / start_new_session here — that keeps CPython
+            # on its vfork fast path, which skips the fork page-table copy.
+            # (posix_spawn itself is off the table: CPython only uses it
+            # when cwd is None, and claude must run in the work dir.)
             proc = subprocess.Popen(
                 claude_args,
+                stdin=subprocess.DEVNULL,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 cwd=self.work_dir,
-                env=env,
+                env=self._child_env,
+                bufsize=0,
             )
             self.current_proc = proc
 
-            # Read stderr in background
-            stderr_lines = []
-            def read_stderr():
-                for line in proc.stderr:
-                    line = line.decode("utf-8", errors="replace").strip()
-                    if line:
+            # Drain both pipes from one selector loop — no dedicated
+            # stderr thread and no join tail when the process exits.
+            # Reads are 64 KiB chunks split on newlines with a carry
+            # buffer per stream, much cheaper than per-line iteration.
+            sel = selectors.DefaultSelector()
+            bufs = {}
+            for stream, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr")):
+                fd = stream.fileno()
+                os.set_blocking(fd, False)
+                sel.register(fd, selectors.EVENT_READ, name)
+                bufs[name] = bytearray()
+
+            # Only the tail is ever reported, so don't hoard verbose stderr
+            stderr_lines = collections.deque(maxlen=8)
+
+            def drain(name, final=False):
+                buf = bufs[name]
+                end = len(buf) if final else buf.rfind(b"\n") + 1
+                if end <= 0:
+                    return
+                ready = bytes(buf[:end]).split(b"\n")
+                del buf[:end]
+                handle_line = self._handle_stdout_line
+                for raw in ready:
+                    raw = raw.rstrip(b"\r\n")
+                    if not raw:
+                        continue
+                    if name == "stdout":
+                        handle_line(raw)
+                    else:
+                        line = raw.decode("utf-8", errors="replace")
                         stderr_lines.append(line)
                         log(f"!!! stderr: {line}")
-            stderr_thread = threading.Thread(target=read_stderr, daemon=True)
-            stderr_thread.start()
 
-            # Read stdout line by line (no buffering issue since process exits)
-            for line in proc.stdout:
-                line = line.decode("utf-8", errors="replace").strip()
-                if not line:
-                    continue
-
-                log(f"<<< {line[:300]}")
-
-                try:
-                    msg = json.loads(line)
-                except json.JSONDecodeError:
-                    log(f"<<< Non-JSON: {line[:200]}")
-                    continue
-
-                # Capture session_id
-                if "session_id" in msg:
-                    self.session_id = msg["session_id"]
-                    log(f"Session: {self.session_id}")
-
-                msg_type = msg.get("type", "")
-
-                if msg_type == "result":
-                    log("Result received")
-
-                # Broadcast to SSE listeners
-                self._broadcast_event("message", msg)
+            # select() and os.read() both drop the GIL while blocked, so
+            # HTTP handlers and SSE writers run freely during the waits;
+            # hoisted lookups trim the Python work in between.
+            select, read = sel.select, os.read
+            while sel.get_map():
+                for key, _ in select(timeout=1.0):
+                    chunk = read(key.fd, 65536)
+                    if chunk:
+                        bufs[key.data] += chunk
+                        drain(key.data)
+                    else:
+                        sel.unregister(key.fd)
+                        drain(key.data, final=True)
+            sel.close()
 
             proc.wait()
-            stderr_thread.join(timeout=2)
             log(f"Process exited with code {proc.returncode}")
 
             if proc.returncode != 0 and stderr_lines:
@@ -147,38 +249,76 @@ class ClaudeBridge:
         finally:
             self.current_proc = None
             self.state = "idle"
+            self._busy.release()
             self._broadcast_event("process_ended", {
                 "sessionId": self.session_id,
             })
 
+    def _handle_stdout_line(self, raw):
+        """Process one raw stream-json line (bytes) from claude stdout."""
+        # Per-line tracing only at DEBUG (BRIDGE_DEBUG=1) — the guard
+        # keeps normal runs from even formatting the message.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("<<< %s", raw[:300])
+
+        has_listeners = bool(self.event_listeners)
+
+        # SSE listeners get the raw bytes untouched; only parse when the
+        # line carries something the bridge itself needs (session id for
+        # --resume, result marker) or a subscriber will actually read it.
+        if b'"session_id"' in raw and (has_listeners or b'"type":"result"' in raw
+                                       or self.session_id is None):
+            try:
+                msg = _json_loads(raw)
+            except json.JSONDecodeError:
+                msg = None
+                log(f"<<< Non-JSON: {raw[:200]}")
+            if msg:
+                if "session_id" in msg and msg["session_id"] != self.session_id:
+                    self.session_id = msg["session_id"]
+                    log(f"Session: {self.session_id}")
+                if msg.get("type") == "result":
+                    log("Result received")
+
+        # With nobody subscribed, framing and fanout are pure waste
+        if has_listeners:
+            self._broadcast_event("message", raw)
+
     def add_listener(self):
-        q = queue.Queue()
+        q = ListenerQueue()
         with self.listeners_lock:
-            self.event_listeners.append(q)
+            self.event_listeners.add(q)
         log(f"SSE listener added (total: {len(self.event_listeners)})")
         return q
 
     def remove_listener(self, q):
         with self.listeners_lock:
-            try:
-                self.event_listeners.remove(q)
-            except ValueError:
-                pass
+            self.event_listeners.discard(q)
         log(f"SSE listener removed (total: {len(self.event_listeners)})")
 
     def _broadcast_event(self, event_type, data):
-        with self.listeners_lock:
-            count = len(self.event_listeners)
-            dead = []
-            for q in self.event_listeners:
-                try:
-                    q.put_nowait((event_type, data))
-                except queue.Full:
-                    dead.append(q)
-            for q in dead:
-                self.event_listeners.remove(q)
-        if count == 0:
-            log(f"WARNING: No SSE listeners for {event_type}")
+        # O(1) handoff to the fanout thread — the producer never touches
+        # listener queues or the listeners lock.
+        self._fanout_q.put((event_type, data))
+
+    def _fanout_worker(self):
+        while True:
+            event_type, data = self._fanout_q.get()
+            # Snapshot under a brief lock, deliver without holding it.
+            with self.listeners_lock:
+                listeners = tuple(self.event_listeners)
+            if not listeners:
+                log(f"WARNING: No SSE listeners for {event_type}")
+                continue
+            # Frame once; every listener sends the same bytes object.
+            if not isinstance(data, bytes):
+                data = orjson.dumps(data) if orjson else json.dumps(data).encode()
+            frame = b"event: " + event_type.encode() + b"\ndata: " + data + b"\n\n"
+            dead = [q for q in listeners if not q.put_nowait(frame)]
+            if dead:
+                with self.listeners_lock:
+                    self.event_listeners.difference_update(dead)
+                log(f"Dropped {len(dead)} slow SSE listener(s)")
 
     def reset(self):
         if self.current_proc and self.current_proc.poll() is None:
@@ -193,6 +333,20 @@ claude = ClaudeBridge(WORK_DIR)
 
 
 class BridgeHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so short requests reuse one socket instead of paying a
+    # TCP handshake per poll (responses carry Content-Length already).
+    protocol_version = "HTTP/1.1"
+
+    # Keep-alive connections hold a pool worker for their whole life;
+    # drop ones that go quiet so idle tabs can't exhaust the pool.
+    # (An SSE stream mis-routed onto the short pool is bounded
+    # separately — see the deadline in _handle_sse.)
+    timeout = 30
+
+    # Serialized /status body keyed on what the response depends on —
+    # the UI polls this endpoint, so repeated polls reuse cached bytes.
+    _status_cache = (None, b"")
+
     def log_message(self, format, *args):
         log(f"{self.command} {self.path}")
 
@@ -202,13 +356,24 @@ class BridgeHandler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
 
     def send_json(self, code, data):
-        body = json.dumps(data).encode()
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", len(body))
-        self.send_cors_headers()
-        self.end_headers()
-        self.wfile.write(body)
+        body = orjson.dumps(data) if orjson else json.dumps(data).encode()
+        self.send_json_bytes(code, body)
+
+    def send_json_bytes(self, code, body):
+        # Status line + headers + body in a single write — the
+        # send_response/send_header machinery does ~6 small writes.
+        self.log_request(code)
+        reason = self.responses.get(code, ("",))[0]
+        head = (
+            "HTTP/1.1 %d %s\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: %d\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n" % (code, reason, len(body))
+        ).encode("latin-1")
+        self.close_connection = False
+        self.wfile.write(head + body)
 
     def read_body(self):
         content_length = int(self.headers.get("Content-Length", 0))
@@ -222,80 +387,87 @@ class BridgeHandler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
-        path = urlparse(self.path).path
+        # partition instead of urlparse — no ParseResult allocation
+        handler = self.ROUTES_GET.get(self.path.partition("?")[0])
+        if handler:
+            handler(self)
+        else:
+            # Drain any body so leftover bytes don't corrupt the next
+            # request on this keep-alive connection
+            self.read_body()
+            self.send_json(404, {"error": "not found"})
 
-        if path == "/status":
-            self.send_json(200, {
+    def do_POST(self):
+        handler = self.ROUTES_POST.get(self.path.partition("?")[0])
+        if handler:
+            handler(self)
+        else:
+            self.read_body()
+            self.send_json(404, {"error": "not found"})
+
+    def _handle_status(self):
+        key = (claude.state, claude.session_id, len(claude.event_listeners), WORK_DIR)
+        cached_key, body = BridgeHandler._status_cache
+        if key != cached_key:
+            data = {
                 "status": "ok",
                 "state": claude.state,
                 "sessionId": claude.session_id,
                 "listeners": len(claude.event_listeners),
                 "workDir": WORK_DIR,
-            })
-            return
-
-        if path == "/events":
-            self._handle_sse()
-            return
-
-        self.send_json(404, {"error": "not found"})
+            }
+            body = orjson.dumps(data) if orjson else json.dumps(data).encode()
+            BridgeHandler._status_cache = (key, body)
+        self.send_json_bytes(200, body)
 
-    def do_POST(self):
-        path = urlparse(self.path).path
+    def _handle_reset(self):
+        claude.reset()
+        self.send_json(200, {"status": "reset"})
 
-        if path == "/reset":
-            claude.reset()
-            self.send_json(200, {"status": "reset"})
+    def _handle_command(self):
+        body = self.read_body()
+        try:
+            data = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON"})
             return
 
-        if path == "/command":
-            body = self.read_body()
-            try:
-                data = json.loads(body) if body else {}
-            except json.JSONDecodeError:
-                self.send_json(400, {"error": "invalid JSON"})
-                return
-
-            command = data.get("command", "").strip()
-            if not command:
-                self.send_json(400, {"error": "command is required"})
-                return
-
-            log(f"Command: {command[:100]}")
-
-            ok, err = claude.send_message(command)
-            if ok:
-                self.send_json(200, {
-                    "status": "sent",
-                    "sessionId": claude.session_id,
-                })
-            else:
-                self.send_json(409, {"error": err})
+        command = data.get("command", "").strip()
+        if not command:
+            self.send_json(400, {"error": "command is required"})
             return
 
-        if path == "/respond":
-            body = self.read_body()
-            try:
-                data = json.loads(body) if body else {}
-            except json.JSONDecodeError:
-                self.send_json(400, {"error": "invalid JSON"})
-                return
+        log(f"Command: {command[:100]}")
 
-            response = data.get("response", "").strip()
-            if not response:
-                self.send_json(400, {"error": "response is required"})
-                return
+        ok, err = claude.send_message(command)
+        if ok:
+            self.send_json(200, {
+                "status": "sent",
+                "sessionId": claude.session_id,
+            })
+        else:
+            self.send_json(409, {"error": err})
 
-            log(f"User response: {response[:100]}")
+    def _handle_respond(self):
+        body = self.read_body()
+        try:
+            data = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
 
-            ok, err = claude.send_message(response)
-            if ok:
-                self.send_json(200, {"status": "sent"})
-            else:
-                self.send_json(409, {"error": err})
+        response = data.get("response", "").strip()
+        if not response:
+            self.send_json(400, {"error": "response is required"})
             return
 
-        self.send_json(404, {"error": "not found"})
+        log(f"User response: {response[:100]}")
+
+        ok, err = claude.send_message(response)
+        if ok:
+            self.send_json(200, {"status": "sent"})
+        else:
+            self.send_json(409, {"error": err})
 
     def _handle_sse(self):
         """SSE endpoint — streams all claude events to the client."""
@@ -306,29 +478,86 @@ class BridgeHandler(BaseHTTPRequestHandler):
         self.send_header("Connection", "keep-alive")
         self.end_headers()
 
+        # Frames arrive fully framed from _broadcast_event; push each one
+        # out in a single send, with Nagle off so small frames aren't held.
+        sock = self.connection
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Routing only peeks the first request on a socket, so a /events
+        # sent later on a reused connection lands here on a short-pool
+        # worker. Cap such streams instead of squatting indefinitely:
+        # the close makes EventSource reconnect on a fresh socket, which
+        # routes to the sse pool.
+        deadline = None
+        if not threading.current_thread().name.startswith("sse"):
+            deadline = time.monotonic() + self.timeout
+
         q = claude.add_listener()
         try:
             while True:
+                wait = 30.0
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        log("SSE stream on short-pool worker hit deadline — closing to re-route")
+                        break
                 try:
-                    event_type, data = q.get(timeout=30)
-                    payload = json.dumps(data) if isinstance(data, dict) else str(data)
-                    self.wfile.write(f"event: {event_type}\ndata: {payload}\n\n".encode())
-                    self.wfile.flush()
+                    sock.sendall(q.get(timeout=wait))
                 except queue.Empty:
-                    self.wfile.write(": keepalive\n\n".encode())
-                    self.wfile.flush()
-        except (BrokenPipeError, ConnectionResetError):
+                    sock.sendall(b": keepalive\n\n")
+        except ListenerQueue.Closed:
+            log("SSE listener closed (too slow, backpressure)")
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
             pass
         finally:
+            # Don't loop back into handle_one_request on this socket —
+            # actually disconnect the client so EventSource reconnects.
+            self.close_connection = True
             claude.remove_listener(q)
 
+    ROUTES_GET = {
+        "/status": _handle_status,
+        "/events": _handle_sse,
+    }
+    ROUTES_POST = {
+        "/reset": _handle_reset,
+        "/command": _handle_command,
+        "/respond": _handle_respond,
+    }
+
 
 class ThreadedHTTPServer(HTTPServer):
-    """Handle each request in a new thread."""
+    """Handle each request on a pooled worker thread.
+
+    Two pools: a small one for the short JSON endpoints and a big one for
+    long-lived /events SSE connections (which hold their thread for the
+    whole session), so SSE clients never starve /command or /status.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        workers = min(64, 8 * (os.cpu_count() or 4))
+        self._exec = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bridge")
+        self._sse_exec = ThreadPoolExecutor(max_workers=256, thread_name_prefix="sse")
+
     def process_request(self, request, client_address):
-        t = threading.Thread(target=self._handle, args=(request, client_address))
-        t.daemon = True
-        t.start()
+        # Hand off immediately — the accept loop must never block on a
+        # client socket (a connection that sends nothing would stall
+        # accept for everyone).
+        self._exec.submit(self._route, request, client_address)
+
+    def _route(self, request, client_address):
+        # Peek the request line without consuming it to route SSE
+        # connections to their own pool. Bounded wait: a silent client
+        # falls through to the default pool and times out there.
+        try:
+            request.settimeout(5.0)
+            head = request.recv(32, socket.MSG_PEEK)
+        except OSError:
+            head = b""
+        if head.startswith(b"GET /events"):
+            self._sse_exec.submit(self._handle, request, client_address)
+        else:
+            self._handle(request, client_address)
 
     def _handle(self, request, client_address):
         try:
@@ -360,6 +589,14 @@ def main():
         log("Shutting down...")
         claude.reset()
         server.shutdown()
+        # Executor workers are non-daemon and concurrent.futures joins
+        # them at interpreter exit, so a lingering SSE connection would
+        # keep the process alive forever. Drain the log queue, then exit
+        # hard without waiting for the pools.
+        server._exec.shutdown(wait=False)
+        server._sse_exec.shutdown(wait=False)
+        _log_listener.stop()
+        os._exit(0)
 
 
 if __name__ == "__main__":